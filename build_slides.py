@@ -8,7 +8,11 @@ from pptx import Presentation
 from pptx.util import Inches, Pt, Emu
 from pptx.enum.text import PP_ALIGN, MSO_ANCHOR
 from pptx.dml.color import RGBColor
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls, qn
+import copy
 import os
+import sys
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 prs = Presentation()
@@ -21,21 +25,58 @@ DARK_BLUE = RGBColor(0x00, 0x3D, 0x7A)
 WHITE = RGBColor(0xFF, 0xFF, 0xFF)
 LIGHT_GRAY_BG = RGBColor(0xF5, 0xF5, 0xF5)
 
+# Lengths reused across slides, built once
+LEFT_MARGIN = Inches(0.7)
+CONTENT_WIDTH = Inches(12)
+TITLE_HEIGHT = Inches(0.6)
+SUBTITLE_HEIGHT = Inches(0.5)
+BODY_HEIGHT = Inches(5)
+ROW_HEIGHT = Inches(0.45)
+IMAGE_LEFT = Inches(0.3)
+IMAGE_TOP = Inches(1.4)
+IMAGE_WIDTH = Inches(12.7)
+BODY_TOP = Inches(1.5)
+PT = {n: Pt(n) for n in (2, 16, 17, 18, 24, 28, 30, 32, 44)}
+
+
+def cell_paragraph_xml(size_pt, color, bold=False):
+    """Build a template <a:p> holding one formatted run for table cells."""
+    return parse_xml(
+        '<a:p %s><a:r><a:rPr lang="en-US" sz="%d"%s><a:solidFill><a:srgbClr val="%s"/>'
+        '</a:solidFill></a:rPr><a:t/></a:r></a:p>'
+        % (nsdecls('a'), size_pt * 100, ' b="1"' if bold else '', color)
+    )
+
+
+def cell_fill_xml(color):
+    """Build a template <a:solidFill> for table cell backgrounds."""
+    return parse_xml('<a:solidFill %s><a:srgbClr val="%s"/></a:solidFill>' % (nsdecls('a'), color))
+
+
+# Table cell XML is built once and copied into each cell, rather than going
+# through python-pptx's per-cell text/font/fill setters.
+HEADER_PARAGRAPH = cell_paragraph_xml(14, WHITE, bold=True)
+BODY_PARAGRAPH = cell_paragraph_xml(13, BLACK)
+HEADER_FILL = cell_fill_xml(DARK_BLUE)
+ROW_FILLS = (cell_fill_xml(LIGHT_GRAY_BG), cell_fill_xml(WHITE))
+
+
+# White background is set once on the slide master and inherited by every
+# slide, and the blank layout is looked up once.
+master_fill = prs.slide_master.background.fill
+master_fill.solid()
+master_fill.fore_color.rgb = WHITE
+LAYOUT_BLANK = prs.slide_layouts[6]
+
 
 def add_slide(title_text, layout_index=6):
     """Add a blank slide and return it."""
-    layout = prs.slide_layouts[layout_index]
-    slide = prs.slides.add_slide(layout)
-    # White background
-    bg = slide.background
-    fill = bg.fill
-    fill.solid()
-    fill.fore_color.rgb = WHITE
-    return slide
-
-
-def add_title(slide, text, top=Inches(0.4), left=Inches(0.7), width=Inches(12), size=Pt(32)):
-    txBox = slide.shapes.add_textbox(left, top, width, Inches(0.6))
+    layout = LAYOUT_BLANK if layout_index == 6 else prs.slide_layouts[layout_index]
+    return prs.slides.add_slide(layout)
+
+
+def add_title(slide, text, top=Inches(0.4), left=LEFT_MARGIN, width=CONTENT_WIDTH, size=PT[32]):
+    txBox = slide.shapes.add_textbox(left, top, width, TITLE_HEIGHT)
     tf = txBox.text_frame
     tf.word_wrap = True
     p = tf.paragraphs[0]
@@ -46,8 +87,8 @@ def add_title(slide, text, top=Inches(0.4), left=Inches(0.7), width=Inches(12),
     return txBox
 
 
-def add_subtitle(slide, text, top=Inches(1.0), left=Inches(0.7), width=Inches(12), size=Pt(18)):
-    txBox = slide.shapes.add_textbox(left, top, width, Inches(0.5))
+def add_subtitle(slide, text, top=Inches(1.0), left=LEFT_MARGIN, width=CONTENT_WIDTH, size=PT[18]):
+    txBox = slide.shapes.add_textbox(left, top, width, SUBTITLE_HEIGHT)
     tf = txBox.text_frame
     tf.word_wrap = True
     p = tf.paragraphs[0]
@@ -57,8 +98,8 @@ def add_subtitle(slide, text, top=Inches(1.0), left=Inches(0.7), width=Inches(12
     return txBox
 
 
-def add_body_text(slide, lines, top=Inches(1.8), left=Inches(0.7), width=Inches(11.5), size=Pt(16), line_spacing=Pt(28)):
-    txBox = slide.shapes.add_textbox(left, top, width, Inches(5))
+def add_body_text(slide, lines, top=Inches(1.8), left=LEFT_MARGIN, width=Inches(11.5), size=PT[16], line_spacing=PT[28]):
+    txBox = slide.shapes.add_textbox(left, top, width, BODY_HEIGHT)
     tf = txBox.text_frame
     tf.word_wrap = True
     for i, line in enumerate(lines):
@@ -73,15 +114,24 @@ def add_body_text(slide, lines, top=Inches(1.8), left=Inches(0.7), width=Inches(
     return txBox
 
 
-def add_table(slide, headers, rows, top=Inches(2.0), left=Inches(0.7), col_widths=None):
+def set_cell_xml(cell, text, paragraph, fill):
+    """Replace a table cell's paragraph and background with copies of template XML."""
+    tc = cell._tc
+    p = copy.deepcopy(paragraph)
+    p.find('.//' + qn('a:t')).text = text
+    txBody = tc.get_or_add_txBody()
+    txBody.replace(txBody.find(qn('a:p')), p)
+    tc.get_or_add_tcPr().append(copy.deepcopy(fill))
+
+
+def add_table(slide, headers, rows, top=Inches(2.0), left=LEFT_MARGIN, col_widths=None):
     n_rows = len(rows) + 1
     n_cols = len(headers)
     if col_widths is None:
         col_widths = [Inches(12 / n_cols)] * n_cols
 
     table_width = sum(col_widths)
-    row_height = Inches(0.45)
-    table_height = row_height * n_rows
+    table_height = ROW_HEIGHT * n_rows
 
     table_shape = slide.shapes.add_table(n_rows, n_cols, left, top, table_width, table_height)
     table = table_shape.table
@@ -91,57 +141,54 @@ def add_table(slide, headers, rows, top=Inches(2.0), left=Inches(0.7), col_width
 
     # Header row
     for j, header in enumerate(headers):
-        cell = table.cell(0, j)
-        cell.text = header
-        for paragraph in cell.text_frame.paragraphs:
-            paragraph.font.size = Pt(14)
-            paragraph.font.bold = True
-            paragraph.font.color.rgb = WHITE
-        cell.fill.solid()
-        cell.fill.fore_color.rgb = DARK_BLUE
-
-    # Data rows
+        set_cell_xml(table.cell(0, j), header, HEADER_PARAGRAPH, HEADER_FILL)
+
+    # Data rows (alternating background)
     for i, row in enumerate(rows):
+        fill = ROW_FILLS[i % 2]
         for j, val in enumerate(row):
-            cell = table.cell(i + 1, j)
-            cell.text = val
-            for paragraph in cell.text_frame.paragraphs:
-                paragraph.font.size = Pt(13)
-                paragraph.font.color.rgb = BLACK
-            if i % 2 == 0:
-                cell.fill.solid()
-                cell.fill.fore_color.rgb = LIGHT_GRAY_BG
-            else:
-                cell.fill.solid()
-                cell.fill.fore_color.rgb = WHITE
+            set_cell_xml(table.cell(i + 1, j), val, BODY_PARAGRAPH, fill)
 
     return table_shape
 
 
 def add_image(slide, img_path, left, top, width=None, height=None):
-    if os.path.exists(img_path):
-        if width and height:
-            slide.shapes.add_picture(img_path, left, top, width, height)
-        elif width:
-            slide.shapes.add_picture(img_path, left, top, width=width)
-        elif height:
-            slide.shapes.add_picture(img_path, left, top, height=height)
-        else:
-            slide.shapes.add_picture(img_path, left, top)
+    if width and height:
+        slide.shapes.add_picture(img_path, left, top, width, height)
+    elif width:
+        slide.shapes.add_picture(img_path, left, top, width=width)
+    elif height:
+        slide.shapes.add_picture(img_path, left, top, height=height)
+    else:
+        slide.shapes.add_picture(img_path, left, top)
+
+
+# Images are checked once up front so a missing file fails the build
+# instead of silently leaving a slide empty.
+customer_img = os.path.expanduser("~/customer.png")
+arch_img = os.path.join(SCRIPT_DIR, "images", "mqtt-sentinel-architecture.png")
+proxy_img = os.path.join(SCRIPT_DIR, "images", "proxy-layer-detail.png")
+inspect_img = os.path.join(SCRIPT_DIR, "images", "security-inspection.png")
+bridge_img = os.path.join(SCRIPT_DIR, "images", "bridge-and-origin.png")
+
+IMAGES = [customer_img, arch_img, proxy_img, inspect_img, bridge_img]
+missing = [p for p in IMAGES if not os.path.exists(p)]
+if missing:
+    sys.exit(f"Missing images: {', '.join(missing)}")
 
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 1: Title
 # ─────────────────────────────────────────────────────────────────
 slide = add_slide("Title")
-add_title(slide, "MQTT Sentinel", top=Inches(2.5), size=Pt(44))
-add_subtitle(slide, "Distributed MQTT Security Platform", top=Inches(3.3), size=Pt(24))
+add_title(slide, "MQTT Sentinel", top=Inches(2.5), size=PT[44])
+add_subtitle(slide, "Distributed MQTT Security Platform", top=Inches(3.3), size=PT[24])
 
 # Thin line
 from pptx.util import Emu
 shape = slide.shapes.add_shape(
     1,  # rectangle
-    Inches(0.7), Inches(3.1), Inches(3), Pt(2)
+    LEFT_MARGIN, Inches(3.1), Inches(3), PT[2]
 )
 shape.fill.solid()
 shape.fill.fore_color.rgb = DARK_BLUE
@@ -154,7 +201,6 @@ slide = add_slide("Customer Arch")
 add_title(slide, "Current Architecture")
 add_subtitle(slide, "WMS MQTT deployment — current state")
 
-customer_img = os.path.expanduser("~/customer.png")
 add_image(slide, customer_img, Inches(0.5), Inches(1.6), width=Inches(12.3))
 
 # ─────────────────────────────────────────────────────────────────
@@ -174,7 +220,7 @@ add_table(slide, ["Parameter", "Value"], [
     ["Retention", "3 days"],
     ["Concurrency", "1.5 million concurrent connections"],
     ["Growth", "500K additional connections per year"],
-], top=Inches(1.5), col_widths=[Inches(3), Inches(9)])
+], top=BODY_TOP, col_widths=[Inches(3), Inches(9)])
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 4: Problem Statement
@@ -188,7 +234,7 @@ add_body_text(slide, [
     "3.  No distributed DDoS protection at the MQTT protocol level — rate limiting, auth brute-force prevention, and packet validation do not exist at the edge.",
     "4.  No visibility into MQTT-specific security events — connection anomalies, malicious payloads, and auth failures are not surfaced in existing monitoring.",
     "5.  Scaling to 1.5M+ connections (growing 500K/year) requires a purpose-built proxy tier, not just broker scaling.",
-], top=Inches(1.5), size=Pt(17), line_spacing=Pt(32))
+], top=BODY_TOP, size=PT[17], line_spacing=PT[32])
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 5: Solution Overview
@@ -197,7 +243,6 @@ slide = add_slide("Solution")
 add_title(slide, "Solution Overview")
 add_subtitle(slide, "MQTT Sentinel — layered security architecture")
 
-arch_img = os.path.join(SCRIPT_DIR, "images", "mqtt-sentinel-architecture.png")
 add_image(slide, arch_img, Inches(0.5), Inches(1.6), width=Inches(12.3))
 
 # ─────────────────────────────────────────────────────────────────
@@ -220,8 +265,7 @@ add_table(slide, ["Protection Layer", "Detail"], [
 slide = add_slide("Proxy Layer")
 add_title(slide, "Proxy Layer — Distributed Edge Security")
 
-proxy_img = os.path.join(SCRIPT_DIR, "images", "proxy-layer-detail.png")
-add_image(slide, proxy_img, Inches(0.3), Inches(1.4), width=Inches(12.7))
+add_image(slide, proxy_img, IMAGE_LEFT, IMAGE_TOP, width=IMAGE_WIDTH)
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 7: Proxy Layer Details
@@ -236,7 +280,7 @@ add_table(slide, ["Capability", "Detail"], [
     ["MQTT Validation", "MQTT 3.1.1 packet parsing — protocol level, packet type, size enforcement"],
     ["DDoS Protection", "Distributed multi-region fleet absorbs volumetric attacks. Horizontal scaling by adding nodes."],
     ["Observability", "Prometheus metrics: connections, rate limit events, auth latency, packet counts"],
-], top=Inches(1.5), col_widths=[Inches(2.5), Inches(9.5)])
+], top=BODY_TOP, col_widths=[Inches(2.5), Inches(9.5)])
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 8: Core Broker — Security Inspection
@@ -244,8 +288,7 @@ add_table(slide, ["Capability", "Detail"], [
 slide = add_slide("Inspection")
 add_title(slide, "Core Broker — Security Inspection")
 
-inspect_img = os.path.join(SCRIPT_DIR, "images", "security-inspection.png")
-add_image(slide, inspect_img, Inches(0.3), Inches(1.4), width=Inches(12.7))
+add_image(slide, inspect_img, IMAGE_LEFT, IMAGE_TOP, width=IMAGE_WIDTH)
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 9: Bridge and Origin Protection
@@ -253,8 +296,7 @@ add_image(slide, inspect_img, Inches(0.3), Inches(1.4), width=Inches(12.7))
 slide = add_slide("Bridge")
 add_title(slide, "Bridge Service — Origin Protection")
 
-bridge_img = os.path.join(SCRIPT_DIR, "images", "bridge-and-origin.png")
-add_image(slide, bridge_img, Inches(0.3), Inches(1.4), width=Inches(12.7))
+add_image(slide, bridge_img, IMAGE_LEFT, IMAGE_TOP, width=IMAGE_WIDTH)
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 10: Origin Protection Detail
@@ -270,7 +312,7 @@ add_body_text(slide, [
     "5.  Origin never receives raw MQTT from the internet. All inbound connections terminate at the distributed proxy layer.",
     "",
     "Result: existing WAF investment is leveraged for MQTT traffic without protocol changes on the origin.",
-], top=Inches(1.5), size=Pt(17), line_spacing=Pt(30))
+], top=BODY_TOP, size=PT[17], line_spacing=PT[30])
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 11: Scale and Performance
@@ -287,17 +329,17 @@ add_table(slide, ["Metric", "Target"], [
     ["Message Retention", "72 hours (3 days)"],
     ["QoS", "Level 1 (at least once)"],
     ["Protocol", "MQTT 3.1.1"],
-], top=Inches(1.5), col_widths=[Inches(4), Inches(8)])
+], top=BODY_TOP, col_widths=[Inches(4), Inches(8)])
 
 # ─────────────────────────────────────────────────────────────────
 # SLIDE 12: Demo
 # ─────────────────────────────────────────────────────────────────
 slide = add_slide("Demo")
-add_title(slide, "Live Demo", top=Inches(2.5), size=Pt(44))
+add_title(slide, "Live Demo", top=Inches(2.5), size=PT[44])
 
 shape = slide.shapes.add_shape(
     1,
-    Inches(0.7), Inches(3.1), Inches(3), Pt(2)
+    LEFT_MARGIN, Inches(3.1), Inches(3), PT[2]
 )
 shape.fill.solid()
 shape.fill.fore_color.rgb = DARK_BLUE
@@ -309,7 +351,7 @@ add_body_text(slide, [
     "3.  Rate limiting under burst traffic",
     "4.  Security inspection — malicious payload detection",
     "5.  Grafana dashboard — real-time security events",
-], top=Inches(3.5), size=Pt(18), line_spacing=Pt(32))
+], top=Inches(3.5), size=PT[18], line_spacing=PT[32])
 
 # ─────────────────────────────────────────────────────────────────
 # Save
@@ -59,6 +59,12 @@ WORKER_COUNT=${#WORKER_IPS[@]}
 USERS_PER_WORKER=$((TOTAL_USERS / WORKER_COUNT))
 SPAWN_RATE_PER_WORKER=$((SPAWN_RATE / WORKER_COUNT))
 
+# Client IDs each locust worker process reserves. The master runs no users,
+# so the load lands on WORKER_COUNT - 1 processes; round up so the busiest
+# one never wraps onto IDs it already has connected.
+USER_RUNNERS=$((WORKER_COUNT > 1 ? WORKER_COUNT - 1 : 1))
+IDS_PER_WORKER=$(((TOTAL_USERS + USER_RUNNERS - 1) / USER_RUNNERS))
+
 echo "============================================================"
 echo "Distributed MQTT Load Test"
 echo "============================================================"
@@ -85,6 +91,7 @@ ssh -o StrictHostKeyChecking=no root@$MASTER_IP "
     # Set environment
     export WORKER_INDEX=0
     export WORKER_COUNT=$WORKER_COUNT
+    export USERS_PER_WORKER=$IDS_PER_WORKER
     export MQTT_BROKER=$TARGET_IP
     export MQTT_PORT=$MQTT_TARGET_PORT
 
@@ -118,6 +125,7 @@ for i in $(seq 1 $((WORKER_COUNT - 1))); do
         # Set environment for this worker
         export WORKER_INDEX=$i
         export WORKER_COUNT=$WORKER_COUNT
+        export USERS_PER_WORKER=$IDS_PER_WORKER
         export MQTT_BROKER=$TARGET_IP
         export MQTT_PORT=$MQTT_TARGET_PORT
 
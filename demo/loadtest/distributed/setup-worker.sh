@@ -16,7 +16,7 @@ cd mqtt-sentinel-demo/demo/loadtest
 # Create venv and install dependencies
 python3 -m venv venv
 source venv/bin/activate
-pip install locust paho-mqtt pyyaml
+pip install locust gmqtt pyyaml
 
 # Update config to use internal cluster DNS or direct IPs
 cat > config.yaml << 'EOF'
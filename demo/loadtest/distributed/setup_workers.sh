@@ -22,6 +22,7 @@ echo "============================================================"
 # Files to copy
 FILES_TO_COPY=(
     "$LOADTEST_DIR/locustfile_distributed.py"
+    "$LOADTEST_DIR/mqtt_client_base.py"
     "$LOADTEST_DIR/requirements.txt"
 )
 
@@ -90,6 +91,7 @@ for i in "${!WORKER_IPS[@]}"; do
     echo "  Running setup script..."
     ssh -o StrictHostKeyChecking=no root@$IP "
         mv /tmp/locustfile_distributed.py /opt/locust/ 2>/dev/null || mkdir -p /opt/locust && mv /tmp/locustfile_distributed.py /opt/locust/
+        mv /tmp/mqtt_client_base.py /opt/locust/
         mv /tmp/requirements.txt /opt/locust/
         $SETUP_SCRIPT
     "
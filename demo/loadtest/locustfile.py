@@ -15,19 +15,26 @@ Configuration (via environment variables):
     USE_TLS         - Enable TLS (default: true)
     CA_CERT_PATH    - Path to CA certificate
     USER_MAX        - Maximum user ID (default: 1500000)
+    SHARED_SUB      - Subscribe via a $share group on the wildcard topic (default: false)
+    SHARED_GROUP    - Shared subscription group name (default: loadtest)
 """
 
+import asyncio
+import functools
+import itertools
 import logging
 import os
 import random
 import ssl
+import sys
 import threading
 import time
-from typing import Optional
+from typing import Dict, List, Optional
 
 import yaml
 from locust import User, task, between, events
-import paho.mqtt.client as mqtt
+from gmqtt import Client as MQTTClient
+from gmqtt.mqtt.constants import MQTTv311
 
 # Configure logging
 logging.basicConfig(
@@ -36,9 +43,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Prefer the libyaml C parser when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YAMLLoader
+except ImportError:
+    from yaml import SafeLoader as YAMLLoader
+
 # Load configuration
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config.yaml')
 
+@functools.lru_cache(maxsize=1)
 def load_config():
     """Load configuration from YAML file or environment variables."""
     config = {
@@ -49,13 +63,15 @@ def load_config():
         'ca_cert_path': os.getenv('CA_CERT_PATH'),
         'user_max': int(os.getenv('USER_MAX', '1500000')),
         'topic_pattern': os.getenv('TOPIC_PATTERN', 'clients/{client_id}/alerts'),
+        'shared_sub': os.getenv('SHARED_SUB', 'false').lower() == 'true',
+        'shared_group': os.getenv('SHARED_GROUP', 'loadtest'),
     }
 
     # Try to load from YAML file
     if os.path.exists(CONFIG_PATH):
         try:
             with open(CONFIG_PATH) as f:
-                yaml_config = yaml.safe_load(f)
+                yaml_config = yaml.load(f, Loader=YAMLLoader)
                 if yaml_config:
                     config.update(yaml_config)
         except Exception as e:
@@ -65,70 +81,236 @@ def load_config():
 
 CONFIG = load_config()
 
+# Hot-path settings bound to module names once
+MQTT_BROKER = CONFIG['mqtt_broker']
+MQTT_PORT = CONFIG['mqtt_port']
+USE_TLS = CONFIG['use_tls']
+CA_CERT_PATH = CONFIG['ca_cert_path']
+USER_MAX = CONFIG['user_max']
+TOPIC_PATTERN = CONFIG['topic_pattern']
+SHARED_SUB = CONFIG['shared_sub']
+
+
+def create_ssl_context() -> Optional[ssl.SSLContext]:
+    """Build the TLS context shared by every subscriber connection."""
+    if not USE_TLS:
+        return None
+    if CA_CERT_PATH:
+        return ssl.create_default_context(cafile=CA_CERT_PATH)
+
+    # Use TLS without certificate verification (for demo/testing)
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+SSL_CONTEXT = create_ssl_context()
+
+# Expected alert payload, compared as raw bytes
+_ALERT_PAYLOAD = b"ALERT"
+
+# Split the topic pattern once so per-client topics are plain concatenation
+_TOPIC_PREFIX, _, _TOPIC_SUFFIX = TOPIC_PATTERN.partition('{client_id}')
+
+# In shared-subscription mode every subscriber joins one $share group on the
+# wildcard alert topic, so the broker keeps a single subscription entry and
+# round-robins alerts across the group instead of one entry per client.
+SHARED_TOPIC = f"$share/{CONFIG['shared_group']}/{_TOPIC_PREFIX}+{_TOPIC_SUFFIX}"
+
+# Alert counters are batched per thread and flushed to Locust once per second
+# instead of firing a request event for every message. Each bucket maps
+# payload validity -> [messages, bytes] and only ever grows; the flusher
+# reports the delta since its previous pass.
+ALERT_FLUSH_INTERVAL = 1.0
+_alert_local = threading.local()
+_alert_buckets: List[Dict[bool, List[int]]] = []
+_alert_buckets_lock = threading.Lock()
+_alert_flusher: Optional[threading.Thread] = None
+
+# Custom stats tracking
+alert_stats = {
+    'total_received': 0,
+    'valid_alerts': 0,
+    'invalid_alerts': 0,
+}
+stats_lock = threading.Lock()
+
+
+def _alert_bucket() -> Dict[bool, List[int]]:
+    """Get this thread's alert counter bucket, registering it on first use."""
+    bucket = getattr(_alert_local, 'bucket', None)
+    if bucket is None:
+        bucket = {True: [0, 0], False: [0, 0]}
+        _alert_local.bucket = bucket
+        with _alert_buckets_lock:
+            _alert_buckets.append(bucket)
+    return bucket
+
+
+def flush_alerts(environment):
+    """
+    Fire one aggregated alert_received event per payload type every interval.
+
+    The event carries the batch's bytes; the rest of the batch's messages
+    are credited straight to Locust's stats, so alert_received still counts
+    messages rather than flushes.
+    """
+    stats = environment.stats
+    flushed = {True: [0, 0], False: [0, 0]}
+    while True:
+        time.sleep(ALERT_FLUSH_INTERVAL)
+        with _alert_buckets_lock:
+            buckets = list(_alert_buckets)
+
+        for valid, seen in flushed.items():
+            count = sum(bucket[valid][0] for bucket in buckets)
+            length = sum(bucket[valid][1] for bucket in buckets)
+            if count == seen[0]:
+                continue
+
+            received = count - seen[0]
+            with stats_lock:
+                alert_stats['total_received'] += received
+                alert_stats['valid_alerts' if valid else 'invalid_alerts'] += received
+
+            error = None if valid else Exception("Unexpected payload")
+            environment.events.request.fire(
+                request_type="MQTT",
+                name="alert_received",
+                response_time=0,
+                response_length=length - seen[1],
+                exception=error,
+                context={"valid": valid, "count": received}
+            )
+            for _ in range(received - 1):
+                stats.log_request("MQTT", "alert_received", 0, 0)
+                if error is not None:
+                    stats.log_error("MQTT", "alert_received", error)
+            seen[0], seen[1] = count, length
+
+
+# Interned client IDs (user1..user_max), cached on first use so only the
+# IDs that are actually drawn are ever formatted
+_client_ids: Dict[int, str] = {}
+
+
+def client_id_for(user_id: int) -> str:
+    """Get the interned client ID for a user ID."""
+    client_id = _client_ids.get(user_id)
+    if client_id is None:
+        client_id = _client_ids[user_id] = sys.intern(f"user{user_id}")
+    return client_id
+
+
+# Random user IDs are drawn in bulk rather than one RNG call per spawned
+# user. Each draw takes the next slot from itertools.count; the lock is
+# only taken when a new batch has to be drawn.
+_ID_BATCH_SIZE = 100_000
+_id_batch: List[int] = []
+_id_batch_round = -1
+_id_draws = itertools.count()
+_id_batch_lock = threading.Lock()
+
+
+def random_client_id() -> str:
+    """Get a random client ID from the pool."""
+    global _id_batch, _id_batch_round
+    draw_round, offset = divmod(next(_id_draws), _ID_BATCH_SIZE)
+    if draw_round > _id_batch_round:
+        with _id_batch_lock:
+            if draw_round > _id_batch_round:
+                _id_batch = random.choices(range(1, USER_MAX + 1), k=_ID_BATCH_SIZE)
+                _id_batch_round = draw_round
+    return client_id_for(_id_batch[offset])
+
+
+# Global asyncio event loop running in background thread
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get or create the background asyncio event loop shared by all subscribers."""
+    global _loop, _loop_thread
+
+    with _loop_lock:
+        if _loop is None or not _loop.is_running():
+            _loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(_loop)
+                _loop.call_soon(ready.set)
+                _loop.run_forever()
+
+            _loop_thread = threading.Thread(target=run_loop, daemon=True)
+            _loop_thread.start()
+
+            # Wait for loop to start
+            ready.wait()
+
+    return _loop
+
+
+def run_async(coro, timeout: float):
+    """Run an async coroutine on the background loop and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    return future.result(timeout=timeout)
+
 
 class MQTTSubscriberClient:
-    """MQTT client that subscribes to a single alert topic."""
+    """MQTT client that subscribes to a single alert topic.
+
+    All subscribers share one background asyncio loop, so each connection
+    costs a coroutine rather than a dedicated network thread.
+    """
 
     def __init__(self, client_id: str, environment):
         self.client_id = client_id
+        self.topic = SHARED_TOPIC if SHARED_SUB else _TOPIC_PREFIX + client_id + _TOPIC_SUFFIX
         self.environment = environment
         self._connected = False
-        self._connect_start: Optional[float] = None
+        self._connect_start_ns = 0
+        self._connect_event: Optional[asyncio.Event] = None
         self.messages_received = 0
-        self.last_message_time: Optional[float] = None
-        self._lock = threading.Lock()
-
-        # Create MQTT client
-        self.client = mqtt.Client(
-            client_id=client_id,
-            protocol=mqtt.MQTTv311,
-            callback_api_version=mqtt.CallbackAPIVersion.VERSION2
-        )
+        self.last_message_time: Optional[int] = None
+        self.client: Optional[MQTTClient] = None
 
-        # Set callbacks
-        self.client.on_connect = self._on_connect
-        self.client.on_disconnect = self._on_disconnect
-        self.client.on_message = self._on_message
-        self.client.on_subscribe = self._on_subscribe
-
-    def connect(self) -> bool:
-        """Connect to MQTT broker and subscribe to alert topic."""
-        self._connect_start = time.time()
+    async def _connect_async(self) -> bool:
+        """Async connection implementation."""
+        self._connect_start_ns = time.monotonic_ns()
+        self._connect_event = asyncio.Event()
 
         try:
-            # Configure TLS if enabled
-            if CONFIG['use_tls']:
-                if CONFIG['ca_cert_path']:
-                    self.client.tls_set(
-                        ca_certs=CONFIG['ca_cert_path'],
-                        cert_reqs=ssl.CERT_REQUIRED
-                    )
-                else:
-                    # Use TLS without certificate verification (for demo/testing)
-                    self.client.tls_set(cert_reqs=ssl.CERT_NONE)
-                    self.client.tls_insecure_set(True)
+            # Create MQTT client
+            self.client = MQTTClient(self.client_id)
 
-            # Set credentials (client_id only auth for demo)
-            self.client.username_pw_set(username=self.client_id, password="")
+            # Set callbacks
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+            self.client.on_message = self._on_message
+            self.client.on_subscribe = self._on_subscribe
 
-            # Connect
-            self.client.connect(
-                CONFIG['mqtt_broker'],
-                CONFIG['mqtt_port'],
-                keepalive=60
+            # Set credentials (client_id only auth for demo)
+            self.client.set_auth_credentials(self.client_id, "")
+
+            # Connect (TLS context is shared by all subscribers)
+            await self.client.connect(
+                MQTT_BROKER,
+                MQTT_PORT,
+                ssl=SSL_CONTEXT,
+                keepalive=60,
+                version=MQTTv311
             )
-            self.client.loop_start()
-
-            # Wait for connection with timeout
-            timeout = 10
-            start = time.time()
-            while not self._connected and (time.time() - start) < timeout:
-                time.sleep(0.1)
 
+            # Wait for CONNACK with timeout
+            await asyncio.wait_for(self._connect_event.wait(), timeout=10)
             return self._connected
 
         except Exception as e:
-            response_time = (time.time() - self._connect_start) * 1000 if self._connect_start else 0
+            response_time = (time.monotonic_ns() - self._connect_start_ns) // 1_000_000
             self.environment.events.request.fire(
                 request_type="MQTT",
                 name="connect",
@@ -137,12 +319,20 @@ class MQTTSubscriberClient:
                 exception=e,
                 context={}
             )
-            logger.error(f"Connection failed for {self.client_id}: {e}")
+            logger.error("Connection failed for %s: %s", self.client_id, e)
+            return False
+
+    def connect(self) -> bool:
+        """Connect to MQTT broker and subscribe to alert topic."""
+        try:
+            return run_async(self._connect_async(), timeout=15)
+        except Exception as e:
+            logger.error("Connection failed for %s: %s", self.client_id, e)
             return False
 
-    def _on_connect(self, client, userdata, flags, rc, properties=None):
+    def _on_connect(self, client, flags, rc, properties):
         """Handle connection callback."""
-        response_time = (time.time() - self._connect_start) * 1000 if self._connect_start else 0
+        response_time = (time.monotonic_ns() - self._connect_start_ns) // 1_000_000
 
         if rc == 0:
             self._connected = True
@@ -156,9 +346,8 @@ class MQTTSubscriberClient:
             )
 
             # Subscribe to this client's alert topic
-            topic = CONFIG['topic_pattern'].format(client_id=self.client_id)
-            self.client.subscribe(topic, qos=1)
-            logger.debug(f"{self.client_id} connected and subscribing to {topic}")
+            self.client.subscribe(self.topic, qos=1)
+            logger.debug("%s connected and subscribing to %s", self.client_id, self.topic)
         else:
             self._connected = False
             self.environment.events.request.fire(
@@ -169,58 +358,87 @@ class MQTTSubscriberClient:
                 exception=Exception(f"Connect failed: rc={rc}"),
                 context={}
             )
-            logger.warning(f"{self.client_id} connection failed: rc={rc}")
+            logger.warning("%s connection failed: rc=%s", self.client_id, rc)
+
+        # Signal that the connection attempt is complete
+        if self._connect_event:
+            self._connect_event.set()
 
-    def _on_disconnect(self, client, userdata, disconnect_flags, rc, properties=None):
+    def _on_disconnect(self, client, packet, exc=None):
         """Handle disconnection callback."""
         self._connected = False
-        if rc != 0:
-            logger.warning(f"{self.client_id} unexpected disconnect: rc={rc}")
+        if exc is not None:
+            logger.warning("%s unexpected disconnect: %s", self.client_id, exc)
 
-    def _on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+    def _on_subscribe(self, client, mid, qos, properties):
         """Handle subscription confirmation."""
-        topic = CONFIG['topic_pattern'].format(client_id=self.client_id)
         self.environment.events.request.fire(
             request_type="MQTT",
             name="subscribe",
             response_time=0,
             response_length=0,
             exception=None,
-            context={"topic": topic}
+            context={"topic": self.topic}
         )
-        logger.debug(f"{self.client_id} subscribed successfully")
+        logger.debug("%s subscribed successfully", self.client_id)
 
-    def _on_message(self, client, userdata, msg):
+    def _on_message(self, client, topic, payload, qos, properties):
         """Handle incoming alert message."""
-        with self._lock:
-            self.messages_received += 1
-            self.last_message_time = time.time()
+        # Only the event loop thread delivers messages to this client
+        self.messages_received += 1
+        self.last_message_time = time.monotonic_ns()
 
-        # Validate payload is expected "ALERT" message
-        payload = msg.payload.decode('utf-8', errors='replace')
-        is_valid = payload == "ALERT"
+        # Validate payload is expected "ALERT" message (raw bytes, no decode)
+        is_valid = payload == _ALERT_PAYLOAD
 
-        self.environment.events.request.fire(
-            request_type="MQTT",
-            name="alert_received",
-            response_time=0,
-            response_length=len(msg.payload),
-            exception=None if is_valid else Exception(f"Unexpected payload: {payload[:50]}"),
-            context={"topic": msg.topic, "valid": is_valid}
-        )
+        counts = _alert_bucket()[is_valid]
+        counts[0] += 1
+        counts[1] += len(payload)
 
         if is_valid:
-            logger.debug(f"{self.client_id} received ALERT on {msg.topic}")
+            logger.debug("%s received ALERT on %s", self.client_id, topic)
         else:
-            logger.warning(f"{self.client_id} received unexpected payload: {payload[:50]}")
+            text = payload[:50].decode('utf-8', errors='replace')
+            logger.warning("%s received unexpected payload: %s", self.client_id, text)
+
+        # PUBACK with success reason code
+        return 0
+
+    async def _disconnect_async(self):
+        """Async disconnect implementation."""
+        if self.client:
+            # Stop gmqtt's auto-reconnect as well, or a client that already
+            # lost its connection keeps reconnecting with this client_id
+            self.client.set_config({'reconnect_retries': 0})
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+            self._connected = False
 
     def disconnect(self):
-        """Disconnect from broker."""
-        if self._connected:
-            self.client.loop_stop()
-            self.client.disconnect()
+        """Disconnect from broker, also stopping a client that is reconnecting."""
+        if self.client:
+            try:
+                run_async(self._disconnect_async(), timeout=5)
+            except Exception:
+                pass
             self._connected = False
 
+    def reset(self):
+        """
+        Stop the current gmqtt client and clear connection state so this
+        client can connect again.
+
+        The topic and message counters are kept; the next connect() builds
+        a new gmqtt client.
+        """
+        self.disconnect()
+        self._connected = False
+        self._connect_start_ns = 0
+        self._connect_event = None
+        self.client = None
+
     @property
     def is_connected(self) -> bool:
         return self._connected
@@ -242,15 +460,14 @@ class AlertSubscriber(User):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Select a random user from the pool
-        user_num = random.randint(1, CONFIG['user_max'])
-        self.client_id = f"user{user_num}"
+        self.client_id = random_client_id()
         self.mqtt_client: Optional[MQTTSubscriberClient] = None
 
     def on_start(self):
         """Called when user starts - connect and subscribe."""
         self.mqtt_client = MQTTSubscriberClient(self.client_id, self.environment)
         if not self.mqtt_client.connect():
-            logger.error(f"Failed to connect {self.client_id}")
+            logger.error("Failed to connect %s", self.client_id)
 
     def on_stop(self):
         """Called when user stops - disconnect."""
@@ -268,10 +485,11 @@ class AlertSubscriber(User):
         """
         if not self.mqtt_client or not self.mqtt_client.is_connected:
             # Try to reconnect
-            logger.info(f"Reconnecting {self.client_id}...")
+            logger.info("Reconnecting %s...", self.client_id)
             if self.mqtt_client:
-                self.mqtt_client.disconnect()
-            self.mqtt_client = MQTTSubscriberClient(self.client_id, self.environment)
+                self.mqtt_client.reset()
+            else:
+                self.mqtt_client = MQTTSubscriberClient(self.client_id, self.environment)
             self.mqtt_client.connect()
             return
 
@@ -289,13 +507,15 @@ class AlertSubscriber(User):
 #
 #     def __init__(self, *args, **kwargs):
 #         super().__init__(*args, **kwargs)
-#         user_num = random.randint(1, CONFIG['user_max'])
-#         self.client_id = f"user{user_num}"  # Use valid user prefix
+#         self.client_id = random_client_id()
 #         self.mqtt_client: Optional[MQTTSubscriberClient] = None
 #
 #     @task
 #     def connect_disconnect_cycle(self):
-#         self.mqtt_client = MQTTSubscriberClient(self.client_id, self.environment)
+#         if self.mqtt_client:
+#             self.mqtt_client.reset()
+#         else:
+#             self.mqtt_client = MQTTSubscriberClient(self.client_id, self.environment)
 #         if self.mqtt_client.connect():
 #             time.sleep(random.uniform(2, 5))
 #         self.mqtt_client.disconnect()
@@ -305,12 +525,23 @@ class AlertSubscriber(User):
 @events.test_start.add_listener
 def on_test_start(environment, **kwargs):
     """Called when test starts."""
+    global _alert_flusher
+
+    # Initialize the event loop
+    get_event_loop()
+
+    if _alert_flusher is None:
+        _alert_flusher = threading.Thread(target=flush_alerts, args=(environment,), daemon=True)
+        _alert_flusher.start()
+
     logger.info("=" * 60)
     logger.info("MQTT Sentinel Load Test Starting")
     logger.info("=" * 60)
     logger.info(f"MQTT Broker: {CONFIG['mqtt_broker']}:{CONFIG['mqtt_port']}")
     logger.info(f"User pool: user1 to user{CONFIG['user_max']}")
     logger.info(f"Topic pattern: {CONFIG['topic_pattern']}")
+    if SHARED_SUB:
+        logger.info(f"Shared subscription: {SHARED_TOPIC}")
     logger.info(f"TLS enabled: {CONFIG['use_tls']}")
     logger.info("=" * 60)
 
@@ -323,27 +554,7 @@ def on_test_stop(environment, **kwargs):
     logger.info("=" * 60)
 
 
-# Custom stats tracking
-alert_stats = {
-    'total_received': 0,
-    'valid_alerts': 0,
-    'invalid_alerts': 0,
-}
-stats_lock = threading.Lock()
-
-
-@events.request.add_listener
-def on_request(request_type, name, response_time, response_length, exception, context, **kwargs):
-    """Track alert-specific metrics."""
-    if request_type == "MQTT" and name == "alert_received":
-        with stats_lock:
-            alert_stats['total_received'] += 1
-            if context.get('valid', False):
-                alert_stats['valid_alerts'] += 1
-            else:
-                alert_stats['invalid_alerts'] += 1
-
-
+# Custom stats reporting (alert_stats is updated by flush_alerts)
 @events.report_to_master.add_listener
 def on_report_to_master(client_id, data):
     """Send custom stats to master in distributed mode."""
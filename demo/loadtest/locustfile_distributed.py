@@ -18,21 +18,25 @@ Environment variables:
     USER_POOL_SIZE  - Total users in database (default: 1500000)
     WORKER_INDEX    - This worker's index (0-based)
     WORKER_COUNT    - Total number of workers
+    USERS_PER_WORKER - Client IDs reserved per worker (default: the worker's
+                       whole slice of USER_POOL_SIZE)
+    MAX_INFLIGHT_HANDSHAKES - Concurrent connect handshakes per worker (default: 128)
+    TLS_SESSION_RESUME - Resume a client's own TLS session on reconnect (default: false)
 """
 
-import asyncio
+import itertools
 import logging
 import os
-import ssl
-import threading
-import time
+import sys
+from collections import Counter
 from dataclasses import dataclass
-from typing import Optional
-from concurrent.futures import Future
+from typing import Dict, Optional
 
 from locust import User, task, between, events
-from gmqtt import Client as MQTTClient
-from gmqtt.mqtt.constants import MQTTv311
+
+from mqtt_client_base import (
+    GMQTTConnectionClient, flush_events, get_event_loop, parse_host, start_event_flusher
+)
 
 # Configure logging
 logging.basicConfig(
@@ -52,7 +56,7 @@ class Config:
     user_pool_size: int = 1500000
     worker_index: int = 0
     worker_count: int = 1
-    users_per_worker: int = 10000
+    users_per_worker: int = 0
     connect_timeout: int = 30
     keepalive: int = 60
 
@@ -67,259 +71,61 @@ def load_config() -> Config:
     config.user_pool_size = int(os.getenv('USER_POOL_SIZE', '1500000'))
     config.worker_index = int(os.getenv('WORKER_INDEX', '0'))
     config.worker_count = int(os.getenv('WORKER_COUNT', '1'))
-    config.users_per_worker = int(os.getenv('USERS_PER_WORKER', '10000'))
+    config.users_per_worker = int(os.getenv('USERS_PER_WORKER', '0'))
     config.connect_timeout = int(os.getenv('CONNECT_TIMEOUT', '30'))
     return config
 
 
 CONFIG = load_config()
 
-
-class UserIDAllocator:
-    """
-    Thread-safe allocator for unique user IDs within a worker.
-
-    User ID space is partitioned across workers:
-    - Worker 0 gets IDs: 1, worker_count+1, 2*worker_count+1, ...
-    - Worker 1 gets IDs: 2, worker_count+2, 2*worker_count+2, ...
-    """
-
-    def __init__(self, worker_index: int, worker_count: int, user_pool_size: int):
-        self.worker_index = worker_index
-        self.worker_count = worker_count
-        self.user_pool_size = user_pool_size
-        self._counter = 0
-        self._lock = threading.Lock()
-        self._base_id = worker_index + 1
-
-    def get_next_user_id(self) -> int:
-        """Get the next unique user ID for this worker."""
-        with self._lock:
-            user_id = self._base_id + (self._counter * self.worker_count)
-            self._counter += 1
-
-            if user_id > self.user_pool_size:
-                self._counter = 0
-                user_id = self._base_id
-                logger.warning(f"User ID wrapped around at worker {self.worker_index}")
-
-            return user_id
-
-    def get_user_count(self) -> int:
-        """Get number of users allocated so far."""
-        with self._lock:
-            return self._counter
-
-
-# Global user ID allocator
-USER_ALLOCATOR: Optional[UserIDAllocator] = None
-
-
-def get_user_allocator() -> UserIDAllocator:
-    """Get or create the user ID allocator."""
-    global USER_ALLOCATOR
-    if USER_ALLOCATOR is None:
-        USER_ALLOCATOR = UserIDAllocator(
-            CONFIG.worker_index,
-            CONFIG.worker_count,
-            CONFIG.user_pool_size
-        )
-    return USER_ALLOCATOR
-
-
-# Global asyncio event loop running in background thread
-_loop: Optional[asyncio.AbstractEventLoop] = None
-_loop_thread: Optional[threading.Thread] = None
-_loop_lock = threading.Lock()
-
-
-def get_event_loop() -> asyncio.AbstractEventLoop:
-    """Get or create the background asyncio event loop."""
-    global _loop, _loop_thread
-
-    with _loop_lock:
-        if _loop is None or not _loop.is_running():
-            _loop = asyncio.new_event_loop()
-
-            def run_loop():
-                asyncio.set_event_loop(_loop)
-                _loop.run_forever()
-
-            _loop_thread = threading.Thread(target=run_loop, daemon=True)
-            _loop_thread.start()
-
-            # Wait for loop to start
-            while not _loop.is_running():
-                time.sleep(0.01)
-
-    return _loop
+# Broker address, resolved once from CONFIG or --host at test start
+BROKER = CONFIG.mqtt_broker
+PORT = CONFIG.mqtt_port
+USE_TLS = CONFIG.use_tls
 
 
-def run_async(coro):
-    """Run an async coroutine from sync code and wait for result."""
-    loop = get_event_loop()
-    future = asyncio.run_coroutine_threadsafe(coro, loop)
-    return future.result(timeout=CONFIG.connect_timeout + 5)
+# User ID space is partitioned across workers:
+# - Worker 0 gets IDs: 1, worker_count+1, 2*worker_count+1, ...
+# - Worker 1 gets IDs: 2, worker_count+2, 2*worker_count+2, ...
+# Client IDs are interned and cached on first use, so only IDs this worker
+# actually hands out are ever formatted.
+_client_ids: Dict[int, str] = {}
 
+# Spawn counter; itertools.count.__next__ is atomic under the GIL
+_next_user_index = itertools.count().__next__
 
-class GMQTTConnectionClient:
-    """gmqtt-based MQTT client wrapper that tracks connection metrics."""
 
-    def __init__(self, client_id: str, environment):
-        self.client_id = client_id
-        self.environment = environment
-        self._connected = False
-        self._connect_start: Optional[float] = None
-        self._connect_error: Optional[str] = None
-        self._connect_event: Optional[asyncio.Event] = None
-        self.client: Optional[MQTTClient] = None
+def get_user_ids() -> range:
+    """Get this worker's slice of user IDs (at most users_per_worker, if set)."""
+    user_ids = range(CONFIG.worker_index + 1, CONFIG.user_pool_size + 1, CONFIG.worker_count)
+    if CONFIG.users_per_worker > 0:
+        user_ids = user_ids[:CONFIG.users_per_worker]
+    return user_ids
 
-    async def _connect_async(self, broker: str, port: int, use_tls: bool) -> bool:
-        """Async connection implementation."""
-        self._connect_start = time.time()
-        self._connect_error = None
-        self._connect_event = asyncio.Event()
 
-        try:
-            # Create client
-            self.client = MQTTClient(self.client_id)
+def client_id_for(user_id: int) -> str:
+    """Get the interned client ID for a user ID."""
+    client_id = _client_ids.get(user_id)
+    if client_id is None:
+        client_id = _client_ids[user_id] = sys.intern(f"{CONFIG.user_prefix}{user_id}")
+    return client_id
 
-            # Set callbacks
-            self.client.on_connect = self._on_connect
-            self.client.on_disconnect = self._on_disconnect
 
-            # Set credentials (username = client_id for auth-callout)
-            self.client.set_auth_credentials(self.client_id, None)
-
-            # Configure TLS
-            ssl_context = None
-            if use_tls:
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-
-            # Connect with timeout
-            await asyncio.wait_for(
-                self.client.connect(broker, port, ssl=ssl_context, version=MQTTv311),
-                timeout=CONFIG.connect_timeout
-            )
-
-            # Wait for CONNACK
-            try:
-                await asyncio.wait_for(
-                    self._connect_event.wait(),
-                    timeout=CONFIG.connect_timeout
-                )
-            except asyncio.TimeoutError:
-                raise Exception(f"CONNACK timeout ({CONFIG.connect_timeout}s)")
-
-            if self._connected:
-                return True
-            elif self._connect_error:
-                raise Exception(self._connect_error)
-            else:
-                raise Exception("Connection failed")
-
-        except Exception as e:
-            response_time = (time.time() - self._connect_start) * 1000
-            self.environment.events.request.fire(
-                request_type="MQTT",
-                name="connect",
-                response_time=response_time,
-                response_length=0,
-                exception=e,
-                context={"client_id": self.client_id}
-            )
-            return False
-
-    def connect(self, broker: str, port: int, use_tls: bool = True) -> bool:
-        """Connect to MQTT broker. Returns True if successful."""
-        try:
-            return run_async(self._connect_async(broker, port, use_tls))
-        except Exception as e:
-            response_time = (time.time() - (self._connect_start or time.time())) * 1000
-            self.environment.events.request.fire(
-                request_type="MQTT",
-                name="connect",
-                response_time=response_time,
-                response_length=0,
-                exception=e,
-                context={"client_id": self.client_id}
-            )
-            return False
-
-    def _on_connect(self, client, flags, rc, properties):
-        """Handle connection callback."""
-        response_time = (time.time() - self._connect_start) * 1000 if self._connect_start else 0
-
-        if rc == 0:
-            self._connected = True
-            self.environment.events.request.fire(
-                request_type="MQTT",
-                name="connect",
-                response_time=response_time,
-                response_length=0,
-                exception=None,
-                context={"client_id": self.client_id}
-            )
-        else:
-            rc_messages = {
-                1: "Incorrect protocol version",
-                2: "Invalid client identifier",
-                3: "Server unavailable",
-                4: "Bad username or password",
-                5: "Not authorized",
-            }
-            error_msg = rc_messages.get(rc, f"Unknown error (rc={rc})")
-            self._connect_error = error_msg
-
-            self.environment.events.request.fire(
-                request_type="MQTT",
-                name="connect",
-                response_time=response_time,
-                response_length=0,
-                exception=Exception(error_msg),
-                context={"client_id": self.client_id, "rc": rc}
-            )
-
-        # Signal that connection attempt is complete
-        if self._connect_event:
-            loop = get_event_loop()
-            loop.call_soon_threadsafe(self._connect_event.set)
-
-    def _on_disconnect(self, client, packet, exc=None):
-        """Handle disconnection callback."""
-        self._connected = False
-
-    async def _disconnect_async(self):
-        """Async disconnect implementation."""
-        if self.client and self._connected:
-            try:
-                await self.client.disconnect()
-            except Exception:
-                pass
-            self._connected = False
-
-    def disconnect(self):
-        """Disconnect from broker."""
-        if self._connected and self.client:
-            try:
-                run_async(self._disconnect_async())
-            except Exception:
-                pass
-            self._connected = False
-
-    @property
-    def is_connected(self) -> bool:
-        return self._connected
+def next_client_id() -> str:
+    """Get the next client ID for this worker, wrapping when the slice is exhausted."""
+    user_ids = get_user_ids()
+    index = _next_user_index()
+    if index and index % len(user_ids) == 0:
+        logger.warning("User ID wrapped around at worker %s", CONFIG.worker_index)
+    return client_id_for(user_ids[index % len(user_ids)])
 
 
 class MQTTConnectionUser(User):
     """
     Locust user that connects to MQTT broker and maintains connection.
 
-    Each user gets a unique client_id from the UserIDAllocator, ensuring
-    no duplicates across workers in distributed mode.
+    Each user gets a unique client_id from this worker's slice of the ID
+    space, ensuring no duplicates across workers in distributed mode.
     """
 
     # Longer wait time to reduce reconnection attempts
@@ -328,39 +134,16 @@ class MQTTConnectionUser(User):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # Get unique user ID from allocator
-        allocator = get_user_allocator()
-        user_num = allocator.get_next_user_id()
-        self.client_id = f"{CONFIG.user_prefix}{user_num}"
+        # Get unique client ID for this worker
+        self.client_id = next_client_id()
         self.mqtt_client: Optional[GMQTTConnectionClient] = None
 
-        # Parse broker from host
-        self.broker = CONFIG.mqtt_broker
-        self.port = CONFIG.mqtt_port
-
-        if not self.broker and self.host:
-            host = self.host
-            if host.startswith("mqtts://"):
-                host = host[8:]
-                self.use_tls = True
-            elif host.startswith("mqtt://"):
-                host = host[7:]
-                self.use_tls = False
-            else:
-                self.use_tls = CONFIG.use_tls
-
-            if ":" in host:
-                self.broker, port_str = host.split(":", 1)
-                self.port = int(port_str)
-            else:
-                self.broker = host
-        else:
-            self.use_tls = CONFIG.use_tls
-
     def on_start(self):
         """Called when user starts - connect to broker."""
-        self.mqtt_client = GMQTTConnectionClient(self.client_id, self.environment)
-        self.mqtt_client.connect(self.broker, self.port, self.use_tls)
+        self.mqtt_client = GMQTTConnectionClient(
+            self.client_id, CONFIG.connect_timeout, CONFIG.keepalive
+        )
+        self.mqtt_client.connect(BROKER, PORT, USE_TLS)
 
     def on_stop(self):
         """Called when user stops - disconnect."""
@@ -374,39 +157,40 @@ class MQTTConnectionUser(User):
             if self.mqtt_client:
                 self.mqtt_client.disconnect()
 
-            self.mqtt_client = GMQTTConnectionClient(self.client_id, self.environment)
-            self.mqtt_client.connect(self.broker, self.port, self.use_tls)
+            self.mqtt_client = GMQTTConnectionClient(
+                self.client_id, CONFIG.connect_timeout, CONFIG.keepalive
+            )
+            self.mqtt_client.connect(BROKER, PORT, USE_TLS)
 
 
-# Connection statistics
-connection_stats = {
-    'total_attempts': 0,
-    'successful': 0,
-    'failed': 0,
-    'auth_failures': 0,
-}
-stats_lock = threading.Lock()
+# Connection statistics. Request events are only fired by flush_events,
+# which runs one flush at a time, so this needs no lock.
+connection_stats: Counter = Counter()
 
 
 @events.request.add_listener
 def on_request(request_type, name, response_time, response_length, exception, context, **kwargs):
     """Track connection statistics."""
     if request_type == "MQTT" and name == "connect":
-        with stats_lock:
-            connection_stats['total_attempts'] += 1
-            if exception:
-                connection_stats['failed'] += 1
-                if context and context.get('rc') in (4, 5):
-                    connection_stats['auth_failures'] += 1
-            else:
-                connection_stats['successful'] += 1
+        connection_stats['total_attempts'] += 1
+        if exception:
+            connection_stats['failed'] += 1
+            if context and context.get('rc') in (4, 5):
+                connection_stats['auth_failures'] += 1
+        else:
+            connection_stats['successful'] += 1
 
 
 @events.test_start.add_listener
 def on_test_start(environment, **kwargs):
     """Called when test starts."""
-    # Initialize the event loop
+    global BROKER, PORT, USE_TLS
+    if not CONFIG.mqtt_broker and environment.host:
+        BROKER, PORT, USE_TLS = parse_host(environment.host, CONFIG.mqtt_port, CONFIG.use_tls)
+
+    # Start the event loop and flusher before spawning
     get_event_loop()
+    start_event_flusher(environment)
 
     logger.info("=" * 60)
     logger.info("MQTT Distributed Load Test (gmqtt)")
@@ -414,7 +198,8 @@ def on_test_start(environment, **kwargs):
     logger.info(f"Worker: {CONFIG.worker_index + 1} of {CONFIG.worker_count}")
     logger.info(f"User pool: {CONFIG.user_prefix}1 to {CONFIG.user_prefix}{CONFIG.user_pool_size}")
     logger.info(f"User ID allocation: interleaved (worker gets every {CONFIG.worker_count}th ID)")
-    logger.info(f"TLS enabled: {CONFIG.use_tls}")
+    logger.info(f"Broker: {BROKER}:{PORT}")
+    logger.info(f"TLS enabled: {USE_TLS}")
     logger.info(f"Connect timeout: {CONFIG.connect_timeout}s")
     logger.info("=" * 60)
 
@@ -422,19 +207,19 @@ def on_test_start(environment, **kwargs):
 @events.test_stop.add_listener
 def on_test_stop(environment, **kwargs):
     """Called when test stops."""
-    allocator = get_user_allocator()
+    # Fire events still queued so the summary below includes them
+    flush_events(environment)
 
     logger.info("=" * 60)
     logger.info("MQTT Distributed Load Test Complete")
     logger.info("=" * 60)
     logger.info(f"Worker {CONFIG.worker_index + 1} stats:")
-    logger.info(f"  Users allocated: {allocator.get_user_count()}")
-    with stats_lock:
-        logger.info(f"  Total attempts: {connection_stats['total_attempts']}")
-        logger.info(f"  Successful: {connection_stats['successful']}")
-        logger.info(f"  Failed: {connection_stats['failed']}")
-        logger.info(f"  Auth failures: {connection_stats['auth_failures']}")
-        if connection_stats['total_attempts'] > 0:
-            success_rate = connection_stats['successful'] / connection_stats['total_attempts'] * 100
-            logger.info(f"  Success rate: {success_rate:.1f}%")
+    logger.info(f"  Users allocated: {_next_user_index()}")
+    logger.info(f"  Total attempts: {connection_stats['total_attempts']}")
+    logger.info(f"  Successful: {connection_stats['successful']}")
+    logger.info(f"  Failed: {connection_stats['failed']}")
+    logger.info(f"  Auth failures: {connection_stats['auth_failures']}")
+    if connection_stats['total_attempts'] > 0:
+        success_rate = connection_stats['successful'] / connection_stats['total_attempts'] * 100
+        logger.info(f"  Success rate: {success_rate:.1f}%")
     logger.info("=" * 60)
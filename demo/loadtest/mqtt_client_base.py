@@ -0,0 +1,582 @@
+"""
+Shared MQTT connection clients for the MQTT Sentinel connection load tests.
+
+GMQTTConnectionClient (gmqtt) is used by locustfile_distributed.py;
+MQTTProbeClient, a minimal CONNECT/CONNACK/PINGREQ client, is used by
+locustfile_connection_test.py. Every client runs on one background asyncio
+event loop, so a worker holds thousands of connections without a thread
+per connection.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, Optional, Set, Tuple
+
+import gevent
+from gevent.event import AsyncResult
+from gmqtt import Client as MQTTClient
+from gmqtt.mqtt.constants import MQTTv311
+
+logger = logging.getLogger(__name__)
+
+# Off by default: the load tests exist to measure full TLS handshakes.
+# When on, only a client's own reconnects resume its previous session.
+TLS_SESSION_RESUME = os.getenv('TLS_SESSION_RESUME', 'false').lower() == 'true'
+
+# Last resumable TLS session per client_id
+_tls_sessions: Dict[str, ssl.SSLSession] = {}
+
+# client_id of the connect running in the current asyncio task, set by the
+# clients before opening the connection and read in wrap_bio
+_tls_client_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    'tls_client_id', default=None
+)
+
+
+class _ResumingSSLObject(ssl.SSLObject):
+    """SSLObject that records its session once the broker has issued one.
+
+    TLS 1.3 tickets arrive after the handshake completes, so the session is
+    re-checked on reads until it carries a ticket.
+    """
+
+    _have_ticket = False
+    _client_id: Optional[str] = None
+
+    def _remember_session(self):
+        session = self.session
+        if session is not None:
+            _tls_sessions[self._client_id] = session
+            self._have_ticket = session.has_ticket
+
+    def do_handshake(self):
+        super().do_handshake()
+        if self._client_id is not None:
+            self._remember_session()
+
+    def read(self, len=1024, buffer=None):
+        data = super().read(len, buffer)
+        if not self._have_ticket and self._client_id is not None:
+            self._remember_session()
+        return data
+
+
+class _ResumingSSLContext(ssl.SSLContext):
+    """SSLContext that offers a client's own cached session when it reconnects."""
+
+    sslobject_class = _ResumingSSLObject
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        client_id = _tls_client_id.get() if TLS_SESSION_RESUME and not server_side else None
+        if session is None and client_id is not None:
+            session = _tls_sessions.get(client_id)
+        sslobj = super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+        sslobj._client_id = client_id
+        return sslobj
+
+
+# One TLS context for every client; the broker cert is not verified.
+# With TLS_SESSION_RESUME, reconnects resume the client's cached session.
+SSL_CTX = _ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+SSL_CTX.check_hostname = False
+SSL_CTX.verify_mode = ssl.CERT_NONE
+SSL_CTX.options &= ~ssl.OP_NO_TICKET
+
+
+# Global asyncio event loop running in background thread. Locust patches
+# threading with gevent, so this "thread" is a greenlet on the hub's OS
+# thread, and asyncio allows only one running loop per OS thread.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def parse_host(host: str, default_port: int, default_tls: bool) -> Tuple[str, int, bool]:
+    """Split a --host value (e.g. mqtts://192.168.1.1:8883) into broker, port and TLS flag."""
+    use_tls = default_tls
+    if host.startswith("mqtts://"):
+        host = host[8:]
+        use_tls = True
+    elif host.startswith("mqtt://"):
+        host = host[7:]
+        use_tls = False
+
+    if ":" in host:
+        broker, port_str = host.split(":", 1)
+        return broker, int(port_str), use_tls
+    return host, default_port, use_tls
+
+
+# Connects queued from greenlets are started together on the loop
+CONNECT_BATCH_INTERVAL = 0.05
+_pending_connects: Deque = deque()
+# The loop only holds weak references to tasks, so running connects live here
+_connect_tasks: Set[asyncio.Task] = set()
+
+# At most this many TCP+TLS+CONNECT exchanges in flight per worker, so a
+# spawn burst does not pile up handshakes
+MAX_INFLIGHT_HANDSHAKES = int(os.getenv('MAX_INFLIGHT_HANDSHAKES', '128'))
+_handshake_sem: Optional[asyncio.Semaphore] = None
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Get or create the background asyncio event loop."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    global _handshake_sem
+                    asyncio.set_event_loop(loop)
+                    _handshake_sem = asyncio.Semaphore(MAX_INFLIGHT_HANDSHAKES)
+                    loop.call_soon(ready.set)
+                    loop.call_soon(_drain_connects, loop)
+                    loop.run_forever()
+
+                threading.Thread(target=run_loop, name="mqtt-loop", daemon=True).start()
+                ready.wait()
+                _loop = loop
+    return _loop
+
+
+async def _run_into(coro, future: Future):
+    """Run a queued coroutine and publish its outcome on a concurrent Future."""
+    if not future.set_running_or_notify_cancel():
+        coro.close()
+        return
+    try:
+        future.set_result(await coro)
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _drain_connects(loop: asyncio.AbstractEventLoop):
+    """Start every connect queued since the last drain in one loop pass."""
+    try:
+        while _pending_connects:
+            task = loop.create_task(_run_into(*_pending_connects.popleft()))
+            _connect_tasks.add(task)
+            task.add_done_callback(_connect_tasks.discard)
+    finally:
+        loop.call_later(CONNECT_BATCH_INTERVAL, _drain_connects, loop)
+
+
+def _wait_for(future: Future, timeout: float):
+    """
+    Wait from a Locust greenlet for a Future completed on an asyncio thread.
+
+    The calling greenlet parks on a gevent AsyncResult instead of blocking
+    in Future.result(), so the hub keeps scheduling other users while the
+    coroutine runs. The asyncio thread hands the result back through the
+    hub's thread-safe callback queue.
+    """
+    hub = gevent.get_hub()
+    result = AsyncResult()
+
+    def deliver(future):
+        if future.cancelled():
+            hub.loop.run_callback_threadsafe(result.set_exception, asyncio.CancelledError())
+        elif future.exception() is not None:
+            hub.loop.run_callback_threadsafe(result.set_exception, future.exception())
+        else:
+            hub.loop.run_callback_threadsafe(result.set, future.result())
+
+    future.add_done_callback(deliver)
+    try:
+        return result.get(timeout=timeout)
+    except gevent.Timeout:
+        future.cancel()
+        raise TimeoutError(f"Timed out after {timeout}s")
+
+
+def run_async(coro, timeout: float):
+    """Run an async coroutine on the background loop and wait for the result."""
+    return _wait_for(asyncio.run_coroutine_threadsafe(coro, get_event_loop()), timeout)
+
+
+def run_batched(coro, timeout: float):
+    """
+    Like run_async, but queue the coroutine for the loop's next batch.
+
+    Queuing is a plain deque append, so a spawn burst costs one loop
+    wakeup per CONNECT_BATCH_INTERVAL instead of one per user.
+    """
+    get_event_loop()
+    future = Future()
+    _pending_connects.append((coro, future))
+    return _wait_for(future, timeout)
+
+
+# Request events are queued here and fired to Locust by one flusher thread.
+# Each record is (name, elapsed_ns, exception, client_id, rc); elapsed time
+# stays in integer nanoseconds until it is handed to Locust.
+EVENT_FLUSH_INTERVAL = 0.1
+EVENT_RING: Deque[tuple] = deque(maxlen=100_000)
+_event_flusher: Optional[threading.Thread] = None
+_flush_lock = threading.Lock()
+
+
+def record(name: str, elapsed_ns: int, exception: Optional[BaseException],
+           client_id: str, rc: Optional[int] = None):
+    """Queue an MQTT request event for the flusher."""
+    EVENT_RING.append((name, elapsed_ns, exception, client_id, rc))
+
+
+def flush_events(environment):
+    """
+    Fire every queued request event to Locust.
+
+    Flushes never overlap, so request listeners only ever run on one
+    thread at a time and can keep unlocked counters.
+    """
+    fire = environment.events.request.fire
+    with _flush_lock:
+        while EVENT_RING:
+            name, elapsed_ns, exception, client_id, rc = EVENT_RING.popleft()
+            context = {"client_id": client_id}
+            if rc is not None:
+                context["rc"] = rc
+            fire(
+                request_type="MQTT",
+                name=name,
+                response_time=elapsed_ns / 1_000_000,
+                response_length=0,
+                exception=exception,
+                context=context
+            )
+
+
+def _flush_events_forever(environment):
+    while True:
+        time.sleep(EVENT_FLUSH_INTERVAL)
+        flush_events(environment)
+
+
+def start_event_flusher(environment):
+    """Start the thread that fires queued request events (once per process)."""
+    global _event_flusher
+    if _event_flusher is None:
+        _event_flusher = threading.Thread(
+            target=_flush_events_forever, args=(environment,), name="mqtt-events", daemon=True
+        )
+        _event_flusher.start()
+
+
+# MQTT 3.1.1 CONNACK return codes
+CONNACK_RC_MESSAGES = {
+    1: "Incorrect protocol version",
+    2: "Invalid client identifier",
+    3: "Server unavailable",
+    4: "Bad username or password",
+    5: "Not authorized",
+}
+
+
+class GMQTTConnectionClient:
+    """gmqtt-based MQTT client wrapper that tracks connection metrics."""
+
+    # One instance per simulated user; no per-instance __dict__
+    __slots__ = (
+        'client_id', 'connect_timeout', 'keepalive', '_connected',
+        '_connect_start_ns', '_connect_error', '_connect_event', 'client',
+    )
+
+    def __init__(self, client_id: str, connect_timeout: int = 30, keepalive: int = 60):
+        self.client_id = client_id
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self._connected = False
+        self._connect_start_ns = 0
+        self._connect_error: Optional[str] = None
+        self._connect_event: Optional[asyncio.Event] = None
+        self.client: Optional[MQTTClient] = None
+
+    async def _connect_async(self, broker: str, port: int, use_tls: bool) -> bool:
+        """Async connection implementation."""
+        self._connect_start_ns = time.monotonic_ns()
+        self._connect_error = None
+        self._connect_event = asyncio.Event()
+        _tls_client_id.set(self.client_id)
+
+        try:
+            # Create client
+            self.client = MQTTClient(self.client_id)
+
+            # Set callbacks
+            self.client.on_connect = self._on_connect
+            self.client.on_disconnect = self._on_disconnect
+
+            # Set credentials (username = client_id for auth-callout)
+            self.client.set_auth_credentials(self.client_id, None)
+
+            ssl_context = SSL_CTX if use_tls else None
+
+            # Slot wait, connect and CONNACK share one deadline, which ends
+            # before the caller's own timeout gives up on this attempt
+            try:
+                await asyncio.wait_for(
+                    self._handshake(broker, port, ssl_context),
+                    timeout=self.connect_timeout
+                )
+            except asyncio.TimeoutError:
+                raise Exception(f"Connect timeout ({self.connect_timeout}s)")
+
+            if self._connected:
+                return True
+            elif self._connect_error:
+                raise Exception(self._connect_error)
+            else:
+                raise Exception("Connection failed")
+
+        except Exception as e:
+            elapsed_ns = time.monotonic_ns() - self._connect_start_ns
+            record("connect", elapsed_ns, e, self.client_id)
+            return False
+
+    async def _handshake(self, broker: str, port: int, ssl_context: Optional[ssl.SSLContext]):
+        """Connect once a handshake slot is free, then wait for CONNACK."""
+        async with _handshake_sem:
+            await self.client.connect(
+                broker, port, ssl=ssl_context, keepalive=self.keepalive, version=MQTTv311
+            )
+        await self._connect_event.wait()
+
+    def connect(self, broker: str, port: int, use_tls: bool = True) -> bool:
+        """Connect to MQTT broker. Returns True if successful."""
+        try:
+            return run_batched(
+                self._connect_async(broker, port, use_tls), timeout=self.connect_timeout + 5
+            )
+        except Exception as e:
+            elapsed_ns = time.monotonic_ns() - self._connect_start_ns if self._connect_start_ns else 0
+            record("connect", elapsed_ns, e, self.client_id)
+            return False
+
+    def _on_connect(self, client, flags, rc, properties):
+        """Handle connection callback."""
+        elapsed_ns = time.monotonic_ns() - self._connect_start_ns if self._connect_start_ns else 0
+
+        if rc == 0:
+            self._connected = True
+            record("connect", elapsed_ns, None, self.client_id)
+        else:
+            error_msg = CONNACK_RC_MESSAGES.get(rc, f"Unknown error (rc={rc})")
+            self._connect_error = error_msg
+
+            record("connect", elapsed_ns, Exception(error_msg), self.client_id, rc)
+
+        # Signal that connection attempt is complete (already on the loop thread)
+        if self._connect_event:
+            self._connect_event.set()
+
+    def _on_disconnect(self, client, packet, exc=None):
+        """Handle disconnection callback."""
+        self._connected = False
+
+    async def _disconnect_async(self):
+        """Async disconnect implementation."""
+        if self.client and self._connected:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+            self._connected = False
+
+    def disconnect(self):
+        """Disconnect from broker."""
+        if self._connected and self.client:
+            try:
+                run_async(self._disconnect_async(), timeout=self.connect_timeout + 5)
+            except Exception:
+                pass
+            self._connected = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+
+# Fixed MQTT 3.1.1 packets used by MQTTProbeClient
+_PINGREQ = b"\xc0\x00"
+_DISCONNECT = b"\xe0\x00"
+_CONNACK_TYPE = 0x20
+
+
+def _encode_remaining_length(length: int) -> bytes:
+    """Encode an MQTT remaining-length varint."""
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        if length:
+            encoded.append(digit | 0x80)
+        else:
+            encoded.append(digit)
+            return bytes(encoded)
+
+
+def connect_packet(client_id: str, keepalive: int) -> bytes:
+    """Build a clean-session MQTT 3.1.1 CONNECT with username = client_id and no password."""
+    cid = client_id.encode()
+    field = len(cid).to_bytes(2, "big") + cid
+    # Protocol name and level 4, flags: username + clean session
+    body = b"\x00\x04MQTT\x04\x82" + keepalive.to_bytes(2, "big") + field + field
+    return b"\x10" + _encode_remaining_length(len(body)) + body
+
+
+class MQTTProbeClient:
+    """
+    Minimal MQTT client for connection tests.
+
+    Sends CONNECT on a raw asyncio stream, reads the 4-byte CONNACK, then
+    keeps the connection open with PINGREQs until disconnect. There is no
+    publish/subscribe state machine, so each connection costs a stream and
+    two small tasks. Same connect/disconnect/is_connected API as
+    GMQTTConnectionClient.
+
+    With auth_only, the client sends DISCONNECT right after a successful
+    CONNACK and reports under the "auth" event name instead of "connect".
+    """
+
+    __slots__ = (
+        'client_id', 'connect_timeout', 'keepalive', 'auth_only', '_event_name',
+        '_connected', '_connect_start_ns', '_writer', '_holder',
+    )
+
+    def __init__(self, client_id: str, connect_timeout: int = 30, keepalive: int = 60,
+                 auth_only: bool = False):
+        self.client_id = client_id
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.auth_only = auth_only
+        self._event_name = "auth" if auth_only else "connect"
+        self._connected = False
+        self._connect_start_ns = 0
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._holder: Optional[asyncio.Task] = None
+
+    async def _connect_async(self, broker: str, port: int, use_tls: bool) -> bool:
+        """Async connection implementation."""
+        self._connect_start_ns = time.monotonic_ns()
+        _tls_client_id.set(self.client_id)
+        writer = None
+
+        async def handshake():
+            nonlocal writer
+            async with _handshake_sem:
+                reader, writer = await asyncio.open_connection(
+                    broker, port, ssl=SSL_CTX if use_tls else None
+                )
+                writer.write(connect_packet(self.client_id, self.keepalive))
+                return reader, await reader.readexactly(4)
+
+        try:
+            # Slot wait, connect and CONNACK share one deadline, which ends
+            # before the caller's own timeout gives up on this attempt
+            try:
+                reader, connack = await asyncio.wait_for(handshake(), timeout=self.connect_timeout)
+            except asyncio.TimeoutError:
+                raise Exception(f"Connect timeout ({self.connect_timeout}s)")
+
+            elapsed_ns = time.monotonic_ns() - self._connect_start_ns
+            if connack[0] != _CONNACK_TYPE:
+                raise Exception(f"Unexpected packet type 0x{connack[0]:02x}")
+
+            rc = connack[3]
+            if rc != 0:
+                writer.close()
+                error_msg = CONNACK_RC_MESSAGES.get(rc, f"Unknown error (rc={rc})")
+                record(self._event_name, elapsed_ns, Exception(error_msg), self.client_id, rc)
+                return False
+
+            if self.auth_only:
+                writer.write(_DISCONNECT)
+                writer.close()
+                record(self._event_name, elapsed_ns, None, self.client_id)
+                return True
+
+            self._writer = writer
+            self._connected = True
+            self._holder = asyncio.ensure_future(self._hold(reader, writer))
+            record(self._event_name, elapsed_ns, None, self.client_id)
+            return True
+
+        except Exception as e:
+            if writer is not None:
+                writer.close()
+            elapsed_ns = time.monotonic_ns() - self._connect_start_ns
+            record(self._event_name, elapsed_ns, e, self.client_id)
+            return False
+
+    async def _ping(self, writer: asyncio.StreamWriter):
+        """Send a PINGREQ every keepalive interval."""
+        while True:
+            await asyncio.sleep(self.keepalive)
+            writer.write(_PINGREQ)
+            await writer.drain()
+
+    async def _hold(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Keep the connection alive until the broker or disconnect() closes it."""
+        pinger = asyncio.ensure_future(self._ping(writer)) if self.keepalive else None
+        try:
+            # Discard PINGRESPs and anything else until EOF
+            while await reader.read(256):
+                pass
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if pinger is not None:
+                # Retrieve the pinger's outcome; a drain() that failed on a
+                # closed socket would otherwise be logged as never retrieved
+                pinger.cancel()
+                try:
+                    await pinger
+                except (asyncio.CancelledError, Exception):
+                    pass
+            self._connected = False
+            writer.close()
+
+    async def _disconnect_async(self):
+        """Async disconnect implementation."""
+        if self._writer and self._connected:
+            try:
+                self._writer.write(_DISCONNECT)
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                pass
+            self._writer.close()
+        if self._holder:
+            self._holder.cancel()
+        self._connected = False
+
+    def connect(self, broker: str, port: int, use_tls: bool = True) -> bool:
+        """Connect to MQTT broker. Returns True if successful."""
+        try:
+            return run_batched(
+                self._connect_async(broker, port, use_tls), timeout=self.connect_timeout + 5
+            )
+        except Exception as e:
+            elapsed_ns = time.monotonic_ns() - self._connect_start_ns if self._connect_start_ns else 0
+            record(self._event_name, elapsed_ns, e, self.client_id)
+            return False
+
+    def disconnect(self):
+        """Disconnect from broker."""
+        if self._connected:
+            try:
+                run_async(self._disconnect_async(), timeout=self.connect_timeout + 5)
+            except Exception:
+                pass
+            self._connected = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
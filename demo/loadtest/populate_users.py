@@ -13,43 +13,214 @@ Usage:
 """
 
 import argparse
+import cProfile
 import os
+import pstats
 import sys
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator
 
 try:
     import mysql.connector
+    from mysql.connector.pooling import CNX_POOL_MAXSIZE, MySQLConnectionPool
 except ImportError:
     print("Error: mysql-connector-python required. Install with: pip install mysql-connector-python")
     sys.exit(1)
 
+# Generous upper bound on the bytes one user row adds to an INSERT statement
+ROW_BYTES_ESTIMATE = 120
 
-def create_users(cursor, start_id: int, count: int, batch_size: int = 1000) -> int:
-    """Insert users in batches. Returns number of users created."""
+_INSERT_SQL = """
+    INSERT IGNORE INTO mqtt_clients
+    (client_id, secret_hash, region, permissions, description)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def user_rows(start_id: int, count: int) -> Iterator[tuple]:
+    """Yield (client_id, secret_hash, region, permissions, description) rows."""
+    # Empty secret_hash means no password required
+    for i in range(start_id, start_id + count):
+        yield (f"loadtest-user-{i}", "", "us-east", None, f"Load test user {i}")
+
+
+def generate_users(start_id: int, count: int, rows_per_insert: int = 5000) -> int:
+    """Build the same row batches create_users would, without executing them.
+
+    Isolates the client-side row generation cost. Returns number of rows
+    generated.
+    """
+    generated = 0
+    end_id = start_id + count
+    rows = user_rows(start_id, count)
+
+    for batch_start in range(start_id, end_id, rows_per_insert):
+        batch = list(islice(rows, min(rows_per_insert, end_id - batch_start)))
+        generated += len(batch)
+
+    return generated
+
+
+def create_users(conn, cursor, start_id: int, count: int,
+                 rows_per_insert: int = 5000, rows_per_commit: int = 50000) -> int:
+    """Insert users in multi-row INSERTs, committing every rows_per_commit rows.
+
+    Returns number of users created.
+    """
     created = 0
+    end_id = start_id + count
+    rows = user_rows(start_id, count)
 
-    for batch_start in range(start_id, start_id + count, batch_size):
-        batch_end = min(batch_start + batch_size, start_id + count)
-        values = []
-
-        for i in range(batch_start, batch_end):
-            client_id = f"loadtest-user-{i}"
-            # Empty secret_hash means no password required
-            values.append(f"('{client_id}', '', 'us-east', NULL, 'Load test user {i}')")
-
-        if values:
-            sql = f"""
-                INSERT IGNORE INTO mqtt_clients
-                (client_id, secret_hash, region, permissions, description)
-                VALUES {','.join(values)}
-            """
-            cursor.execute(sql)
-            created += cursor.rowcount
-            print(f"  Inserted batch {batch_start}-{batch_end-1} ({cursor.rowcount} new users)")
+    for commit_start in range(start_id, end_id, rows_per_commit):
+        commit_end = min(commit_start + rows_per_commit, end_id)
+        window_start = time.time()
+        window_created = 0
+
+        # One explicit transaction per window, so the redo log is flushed
+        # once at commit rather than per statement
+        conn.start_transaction()
+        for batch_start in range(commit_start, commit_end, rows_per_insert):
+            batch = list(islice(rows, min(rows_per_insert, commit_end - batch_start)))
+            # executemany rewrites this into one multi-row INSERT per batch
+            cursor.executemany(_INSERT_SQL, batch)
+            window_created += cursor.rowcount
+
+        conn.commit()
+        created += window_created
+        rate = (commit_end - commit_start) / max(time.time() - window_start, 1e-9)
+        print(f"  Committed {commit_start}-{commit_end-1} ({window_created} new users, {rate:.0f} rows/sec)")
 
     return created
 
 
+def set_bulk_checks(cursor, enabled: bool, unique: bool = True):
+    """Turn this session's foreign key checks, and unique checks unless unique is False, on or off."""
+    value = 1 if enabled else 0
+    if unique:
+        cursor.execute(f"SET unique_checks={value}, foreign_key_checks={value}")
+    else:
+        cursor.execute(f"SET foreign_key_checks={value}")
+
+
+def create_users_parallel(pool, start_id: int, count: int, threads: int,
+                          rows_per_insert: int, rows_per_commit: int,
+                          relax_checks: bool = False, relax_unique: bool = False) -> int:
+    """Split the ID range into one contiguous slice per writer thread.
+
+    Each thread takes its own connection from the pool, with bulk checks
+    disabled on it if relax_checks is set (unique checks too only if
+    relax_unique is also set). Returns number of users created.
+    """
+    slice_size = -(-count // threads)
+
+    def write_slice(slice_start: int, slice_count: int) -> int:
+        conn = pool.get_connection()
+        try:
+            cursor = conn.cursor()
+            try:
+                if relax_checks:
+                    set_bulk_checks(cursor, False, relax_unique)
+                return create_users(conn, cursor, slice_start, slice_count, rows_per_insert, rows_per_commit)
+            finally:
+                if relax_checks:
+                    set_bulk_checks(cursor, True, relax_unique)
+                cursor.close()
+        finally:
+            conn.close()
+
+    end_id = start_id + count
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(write_slice, slice_start, min(slice_size, end_id - slice_start))
+            for slice_start in range(start_id, end_id, slice_size)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def load_users(conn, cursor, start_id: int, count: int) -> int:
+    """Bulk-load users from a temporary CSV with LOAD DATA LOCAL INFILE.
+
+    Returns number of users created. Raises mysql.connector.Error if the
+    server or connection does not allow LOCAL INFILE.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+        # Empty secret_hash means no password required; \N loads as NULL
+        f.writelines(
+            f"loadtest-user-{i},,us-east,\\N,Load test user {i}\n"
+            for i in range(start_id, start_id + count)
+        )
+        path = f.name
+
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE '{path}'
+            IGNORE INTO TABLE mqtt_clients
+            FIELDS TERMINATED BY ','
+            LINES TERMINATED BY '\\n'
+            (client_id, secret_hash, region, permissions, description)
+        """)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        os.unlink(path)
+
+
+def relax_durability(cursor):
+    """Set innodb_flush_log_at_trx_commit=2 server-wide for the load.
+
+    Commits then write the redo log without an fsync each time; it is
+    flushed about once a second instead. Returns the previous value to
+    pass to restore_durability, or None if the setting could not be
+    changed (it needs SUPER or SYSTEM_VARIABLES_ADMIN).
+    """
+    try:
+        cursor.execute("SELECT @@GLOBAL.innodb_flush_log_at_trx_commit")
+        previous = cursor.fetchone()[0]
+        cursor.execute("SET GLOBAL innodb_flush_log_at_trx_commit = 2")
+    except mysql.connector.Error as e:
+        print(f"Warning: could not set innodb_flush_log_at_trx_commit=2 ({e})")
+        print("  For faster seeding, ask an admin to run "
+              "SET GLOBAL innodb_flush_log_at_trx_commit=2 for the load window")
+        return None
+    print(f"Set innodb_flush_log_at_trx_commit=2 for the load (was {previous})")
+    return previous
+
+
+def restore_durability(cursor, previous):
+    """Put innodb_flush_log_at_trx_commit back to the value relax_durability saw."""
+    try:
+        cursor.execute("SET GLOBAL innodb_flush_log_at_trx_commit = %s", (previous,))
+    except mysql.connector.Error as e:
+        print(f"Warning: could not restore innodb_flush_log_at_trx_commit={previous} ({e})")
+
+
+def get_max_allowed_packet(cursor) -> int:
+    """Get the server's max_allowed_packet in bytes."""
+    cursor.execute("SHOW VARIABLES LIKE 'max_allowed_packet'")
+    return int(cursor.fetchone()[1])
+
+
+def delete_users(conn, cursor, chunk_size: int = 10000, prefix: str = "loadtest-user-") -> int:
+    """Delete loadtest users in chunks, committing after each.
+
+    Keeps each transaction (and its undo log) small. Returns number of
+    users deleted.
+    """
+    deleted = 0
+    while True:
+        cursor.execute(
+            "DELETE FROM mqtt_clients WHERE client_id LIKE %s LIMIT %s",
+            (f"{prefix}%", chunk_size)
+        )
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < chunk_size:
+            return deleted
+
+
 def get_user_count(cursor, prefix: str = "loadtest-user-") -> int:
     """Get count of existing loadtest users."""
     cursor.execute(
@@ -68,10 +239,33 @@ def main():
     parser.add_argument("--database", default=os.getenv("DB_NAME", "mqtt_auth"), help="Database name")
     parser.add_argument("--count", type=int, default=5000, help="Number of users to create")
     parser.add_argument("--start", type=int, default=1, help="Starting user ID")
-    parser.add_argument("--batch-size", type=int, default=1000, help="Batch size for inserts")
+    parser.add_argument("--rows-per-insert", "--batch-size", dest="rows_per_insert", type=int, default=5000,
+                        help="Rows per multi-row INSERT (clamped to fit max_allowed_packet)")
+    parser.add_argument("--rows-per-commit", type=int, default=50000, help="Rows per transaction commit")
     parser.add_argument("--delete", action="store_true", help="Delete existing loadtest users first")
+    parser.add_argument("--delete-chunk-size", type=int, default=10000, help="Rows per DELETE transaction")
+    parser.add_argument("--writer-threads", type=int, default=1,
+                        help=f"Parallel INSERT connections (1-{CNX_POOL_MAXSIZE})")
+    parser.add_argument("--fast-load", action="store_true",
+                        help="Bulk-load via LOAD DATA LOCAL INFILE (falls back to INSERTs if disabled) "
+                             "with foreign key checks off during the load, and unique checks too if no "
+                             "loadtest users exist yet")
+    parser.add_argument("--relax-durability", action="store_true",
+                        help="Set GLOBAL innodb_flush_log_at_trx_commit=2 during the load and restore it "
+                             "afterwards (needs SUPER; affects every session on the server)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only generate the INSERT row batches, without connecting to the database")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the create phase and print the top 20 functions by cumulative time "
+                             "(main thread only)")
 
     args = parser.parse_args()
+    if args.rows_per_insert < 1 or args.rows_per_commit < 1:
+        parser.error("--rows-per-insert and --rows-per-commit must be positive")
+    if args.delete_chunk_size < 1:
+        parser.error("--delete-chunk-size must be positive")
+    if not 1 <= args.writer_threads <= CNX_POOL_MAXSIZE:
+        parser.error(f"--writer-threads must be between 1 and {CNX_POOL_MAXSIZE}")
 
     print("=" * 60)
     print("MQTT Auth Database User Population")
@@ -81,14 +275,33 @@ def main():
     print(f"Target users: {args.count} (starting at {args.start})")
     print("=" * 60)
 
+    profiler = cProfile.Profile() if args.profile else None
+
+    if args.dry_run:
+        print(f"\nDry run: generating {args.count} rows, {args.rows_per_insert} per batch...")
+        start_time = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        generated = generate_users(args.start, args.count, args.rows_per_insert)
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - start_time
+        print(f"Generated: {generated} rows in {elapsed:.2f}s ({generated/max(elapsed, 1e-9):.0f} rows/sec)")
+        if profiler:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        return
+
+    db_config = {
+        "host": args.host,
+        "port": args.port,
+        "user": args.user,
+        "password": args.password,
+        "database": args.database,
+        "autocommit": False,
+    }
+
     try:
-        conn = mysql.connector.connect(
-            host=args.host,
-            port=args.port,
-            user=args.user,
-            password=args.password,
-            database=args.database
-        )
+        conn = mysql.connector.connect(**db_config, allow_local_infile=args.fast_load)
         cursor = conn.cursor()
 
         # Check existing users
@@ -97,20 +310,63 @@ def main():
 
         if args.delete and existing > 0:
             print("Deleting existing loadtest users...")
-            cursor.execute("DELETE FROM mqtt_clients WHERE client_id LIKE 'loadtest-user-%'")
-            conn.commit()
-            print(f"  Deleted {cursor.rowcount} users")
+            deleted = delete_users(conn, cursor, args.delete_chunk_size)
+            print(f"  Deleted {deleted} users")
             existing = 0
 
+        # Keep each multi-row INSERT under the server's packet limit
+        max_rows = max(1, get_max_allowed_packet(cursor) // ROW_BYTES_ESTIMATE)
+        if args.rows_per_insert > max_rows:
+            print(f"Clamping rows per insert from {args.rows_per_insert} to {max_rows} (max_allowed_packet)")
+            args.rows_per_insert = max_rows
+
+        # End the read transaction the checks above opened (autocommit is
+        # off), so create_users can start its own
+        conn.commit()
+
         # Create users
         print(f"\nCreating {args.count} users...")
+        print(f"Rows per insert: {args.rows_per_insert}, rows per commit: {args.rows_per_commit}")
+        print(f"Writer threads: {args.writer_threads}")
         start_time = time.time()
-        created = create_users(cursor, args.start, args.count, args.batch_size)
-        conn.commit()
+        created = None
+        previous_flush = relax_durability(cursor) if args.relax_durability else None
+        if profiler:
+            profiler.enable()
+        # Unique checks may only be skipped on an empty target range, or a
+        # rerun could insert duplicates that IGNORE no longer catches
+        relax_unique = existing == 0
+        if args.fast_load:
+            if not relax_unique:
+                print("Loadtest users already exist, keeping unique checks on (use --delete to skip them)")
+            # Skip per-row lookups for the load window only
+            set_bulk_checks(cursor, False, relax_unique)
+        try:
+            if args.fast_load:
+                try:
+                    created = load_users(conn, cursor, args.start, args.count)
+                except mysql.connector.Error as e:
+                    conn.rollback()
+                    print(f"LOAD DATA LOCAL INFILE failed ({e}), falling back to INSERTs")
+            if created is None and args.writer_threads > 1:
+                pool = MySQLConnectionPool(pool_name="populate_users", pool_size=args.writer_threads, **db_config)
+                created = create_users_parallel(
+                    pool, args.start, args.count, args.writer_threads, args.rows_per_insert, args.rows_per_commit,
+                    relax_checks=args.fast_load, relax_unique=relax_unique
+                )
+            elif created is None:
+                created = create_users(conn, cursor, args.start, args.count, args.rows_per_insert, args.rows_per_commit)
+        finally:
+            if args.fast_load:
+                set_bulk_checks(cursor, True, relax_unique)
+            if previous_flush is not None:
+                restore_durability(cursor, previous_flush)
+            if profiler:
+                profiler.disable()
         elapsed = time.time() - start_time
 
-        # Final count
-        total = get_user_count(cursor)
+        # INSERT IGNORE / LOAD DATA IGNORE only count rows that were new
+        total = existing + created
 
         print("=" * 60)
         print(f"Created: {created} new users")
@@ -118,6 +374,9 @@ def main():
         print(f"Time: {elapsed:.2f}s ({created/elapsed:.0f} users/sec)")
         print("=" * 60)
 
+        if profiler:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+
         cursor.close()
         conn.close()
 